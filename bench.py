@@ -0,0 +1,303 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import os
+import random
+import time
+import tracemalloc
+
+os.environ.setdefault("STATE_DB", "")
+os.environ.setdefault("METRICS_PORT", "0")
+os.environ.setdefault("UPSTREAM_TIMEOUT", "3")
+os.environ.setdefault("UPSTREAM_MAX_TIMEOUT", "5")
+os.environ.setdefault("INTERROGATOR_TIMEOUT", "3")
+os.environ.setdefault("BREAKER_RESET", "2")
+os.environ.setdefault("USER_RATE_PER_MINUTE", "0")
+os.environ.setdefault("GUILD_RATE_PER_MINUTE", "0")
+
+import discord
+import httpx
+from PIL import Image
+
+import main
+from cache import LRUCache, ResultCache, SingleFlight
+from client_pool import ImaginePool
+from resilience import CircuitBreaker, LatencyTracker
+from scheduler import Coalescer, FairQueue, RateLimiter, ServiceRate
+
+
+ids = itertools.count(1_000_000)
+
+
+def make_png(width: int, height: int) -> bytes:
+    image = Image.effect_noise((width, height), 64).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class FakeImagine:
+    def __init__(self, options, result: bytes):
+        self.options = options
+        self.result = result
+
+    async def _respond(self):
+        options = self.options
+        roll = random.random()
+        if roll < options.timeout_rate:
+            await asyncio.sleep(3600)
+        await asyncio.sleep(max(0.0, random.gauss(options.latency, options.jitter)))
+        if roll < options.timeout_rate + options.error_rate:
+            request = httpx.Request("POST", "https://fake.imagine/controlnet")
+            raise httpx.HTTPStatusError("fake upstream error", request=request, response=httpx.Response(503, request=request))
+
+    async def interrogator(self, content: bytes):
+        await self._respond()
+        return "a fake caption, with details"
+
+    async def controlnet(self, **kwargs):
+        await self._respond()
+        return self.result
+
+    async def close(self):
+        pass
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+
+
+class FakeAttachment:
+    def __init__(self, data: bytes, options):
+        self.data = data
+        self.options = options
+        self.filename = "source.png"
+
+    async def read(self):
+        await asyncio.sleep(self.options.discord_latency)
+        return self.data
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content="", attachments=(), embeds=(), message_id=None, on_reply=None):
+        self.id = message_id or next(ids)
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.attachments = list(attachments)
+        self.embeds = list(embeds)
+        self.reference = None
+        self.on_reply = on_reply
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, guild, options):
+        self.id = channel_id
+        self.guild = guild
+        self.options = options
+        self.messages = {}
+        self.bot_user = FakeUser(1)
+
+    async def fetch_message(self, message_id: int):
+        await asyncio.sleep(self.options.discord_latency)
+        return self.messages[message_id]
+
+    async def send(self, content=None, file=None, embed=None, view=None, on_reply=None):
+        await asyncio.sleep(self.options.discord_latency)
+        if file is not None:
+            file.fp.read()
+        message = FakeMessage(self, self.bot_user, content or "", embeds=[embed] if embed else [])
+        self.messages[message.id] = message
+        if view is not None:
+            view.stop()
+        if on_reply is not None:
+            on_reply(file is not None)
+        return message
+
+
+class FakeContext:
+    def __init__(self, message, author):
+        self.message = message
+        self.author = author
+        self.channel = message.channel
+        self.guild = message.guild
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content=content, on_reply=self.message.on_reply, **kwargs)
+
+
+class FakeFollowup:
+    async def send(self, content=None, ephemeral=False):
+        pass
+
+
+class FakeResponse:
+    async def defer(self, ephemeral=False):
+        pass
+
+
+class FakeInteraction:
+    def __init__(self, message, user, custom_id: str, values=None):
+        self.type = discord.InteractionType.component
+        self.message = message
+        self.channel = message.channel
+        self.user = user
+        self.data = {"custom_id": custom_id, "values": values or []}
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+
+async def fake_get_context(message):
+    return FakeContext(message, message.author)
+
+
+class Run:
+    def __init__(self):
+        self.latencies = []
+        self.ok = 0
+        self.failed = 0
+        self.pending = set()
+
+    def track(self):
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self.pending.add(future)
+
+        def on_reply(success: bool):
+            if future.done():
+                return
+            self.latencies.append(time.perf_counter() - started)
+            if success:
+                self.ok += 1
+            else:
+                self.failed += 1
+            future.set_result(None)
+
+        return on_reply
+
+
+def reset(workers: int, options, result: bytes):
+    for task in main.workers:
+        task.cancel()
+    main.workers.clear()
+    main.worker_count = workers
+    main.task_queue = FairQueue(maxsize=options.jobs * 2)
+    main.coalescer = Coalescer()
+    main.service_rate = ServiceRate()
+    main.user_limiter = RateLimiter(main.user_limiter.rate * 60, main.user_limiter.burst)
+    main.guild_limiter = RateLimiter(main.guild_limiter.rate * 60, main.guild_limiter.burst)
+    main.imagine_pool = ImaginePool(workers, factory=lambda: FakeImagine(options, result))
+    for upstream in (main.controlnet_upstream, main.interrogator_upstream):
+        upstream.pool = main.imagine_pool
+        upstream.hedge = options.hedge
+        upstream.latency = LatencyTracker()
+        upstream.breaker = CircuitBreaker(upstream.breaker.failure_threshold, upstream.breaker.reset_timeout)
+    main.result_cache = ResultCache(64 * 1024 * 1024)
+    main.attachment_cache = LRUCache(128 * 1024 * 1024, ttl=main.source_cache_ttl)
+    main.message_cache = LRUCache(1000, sizeof=lambda message: 1, ttl=main.source_cache_ttl)
+    main.caption_cache = LRUCache(5000, sizeof=lambda caption: 1)
+    main.fetch_flight = SingleFlight()
+    main.interrogation_flight = SingleFlight()
+
+
+async def seed_result_message(channel, source, user):
+    run = Run()
+    ctx = FakeContext(FakeMessage(channel, user, attachments=source.attachments, message_id=source.id, on_reply=run.track()), user)
+    await main.remix.callback(ctx, command_args="a benchmark prompt --seed 42")
+    await asyncio.gather(*run.pending)
+    return max(channel.messages.values(), key=lambda message: message.id)
+
+
+async def run_level(workers: int, options, source_png: bytes, result_png: bytes):
+    reset(workers, options, result_png)
+    main.start_workers()
+    guilds = [FakeGuild(next(ids)) for _ in range(options.guilds)]
+    channels = [FakeChannel(next(ids), guild, options) for guild in guilds]
+    users = [FakeUser(next(ids)) for _ in range(options.users)]
+    sources = []
+    for channel in channels:
+        source = FakeMessage(channel, users[0], attachments=[FakeAttachment(source_png, options)])
+        channel.messages[source.id] = source
+        sources.append(source)
+    bot_messages = [await seed_result_message(source.channel, source, users[0]) for source in sources]
+
+    run = Run()
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _ in range(options.jobs):
+        user = random.choice(users)
+        if random.random() < options.interaction_share:
+            bot_message = random.choice(bot_messages)
+            custom_id, values = random.choice([("remix_button", []), ("random_style_button", []), ("strength_select", ["50"])])
+            message = FakeMessage(bot_message.channel, user, bot_message.content, embeds=bot_message.embeds, message_id=bot_message.id, on_reply=run.track())
+            await main.on_interaction(FakeInteraction(message, user, custom_id, values))
+        else:
+            source = random.choice(sources)
+            message = FakeMessage(source.channel, user, attachments=source.attachments, message_id=source.id, on_reply=run.track())
+            await main.remix.callback(FakeContext(message, user), command_args=options.prompt)
+        if options.arrival_interval:
+            await asyncio.sleep(random.expovariate(1 / options.arrival_interval))
+    await asyncio.wait_for(asyncio.gather(*run.pending), timeout=options.deadline)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return run, elapsed, peak, main.coalescer.coalesced
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else float("nan")
+
+
+async def benchmark(options):
+    source_png = make_png(options.source_width, options.source_height)
+    result_png = make_png(768, 768)
+    main.bot.get_context = fake_get_context
+    print(f"{'workers':>7} {'jobs':>5} {'ok':>5} {'failed':>6} {'coalesced':>9} {'jobs/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'peak MB':>8}")
+    for workers in options.levels:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output) if not options.verbose else contextlib.nullcontext():
+            run, elapsed, peak, coalesced = await run_level(workers, options, source_png, result_png)
+        latencies = run.latencies
+        print(f"{workers:>7} {options.jobs:>5} {run.ok:>5} {run.failed:>6} {coalesced:>9} {len(latencies) / elapsed:>7.2f} "
+              f"{percentile(latencies, 0.50):>7.2f} {percentile(latencies, 0.95):>7.2f} {percentile(latencies, 0.99):>7.2f} {peak / 1024 / 1024:>8.1f}")
+    for task in main.workers:
+        task.cancel()
+    main.image_executor.shutdown(wait=False)
+
+
+def parse_options():
+    parser = argparse.ArgumentParser(description="Offline load test for the remix queue using fake Discord and Imagine backends")
+    parser.add_argument("--levels", type=lambda value: [int(level) for level in value.split(",")], default=[1, 2, 4, 8], help="comma separated worker counts to test")
+    parser.add_argument("--jobs", type=int, default=100, help="jobs submitted per level")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--guilds", type=int, default=3)
+    parser.add_argument("--prompt", default="a benchmark prompt", help="arguments passed to !remix; leave the prompt empty to exercise interrogation")
+    parser.add_argument("--interaction-share", type=float, default=0.5, help="fraction of jobs submitted through on_interaction")
+    parser.add_argument("--arrival-interval", type=float, default=0.0, help="mean seconds between submissions, 0 submits everything at once")
+    parser.add_argument("--latency", type=float, default=0.5, help="mean fake upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="standard deviation of the fake upstream latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls that fail with HTTP 503")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="fraction of upstream calls that never answer")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="fake Discord REST latency in seconds")
+    parser.add_argument("--source-width", type=int, default=2048)
+    parser.add_argument("--source-height", type=int, default=1536)
+    parser.add_argument("--hedge", action="store_true", help="enable hedged upstream requests")
+    parser.add_argument("--deadline", type=float, default=600, help="seconds to wait for a level to finish")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own logging")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark(parse_options()))
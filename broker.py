@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+from journal import JOB_COLUMNS, JobJournal
+from scheduler import ServiceRate
+
+
+class LocalBroker(JobJournal):
+    def __init__(self, path: str, flush_interval: float = 0.05, batch_size: int = 100, max_attempts: int = 3, lease: float = 600, recount_interval: float = 1.0):
+        if not path:
+            raise ValueError("LocalBroker needs a database path shared by the gateway and worker processes")
+        super().__init__(path, flush_interval, batch_size, max_attempts)
+        self.lease = lease
+        with self._lock:
+            self._db.execute("CREATE INDEX IF NOT EXISTS job_journal_claim ON job_journal (priority, enqueued_at)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS broker_stats (id INTEGER PRIMARY KEY CHECK (id = 0), completed INTEGER)")
+            self._db.execute("INSERT OR IGNORE INTO broker_stats (id, completed) VALUES (0, 0)")
+            self._db.commit()
+        self.recount_interval = recount_interval
+        self.running = 0
+        self.service_rate = ServiceRate()
+        self._depth = 0
+        self._completed = None
+        self._counted_at = 0.0
+
+    @property
+    def depth(self) -> int:
+        return self._depth + len(self._appends)
+
+    def checkout(self, job_id: str):
+        pass
+
+    async def flush(self):
+        wrote = bool(self._appends or self._checkouts or self._acks)
+        await super().flush()
+        if wrote or time.monotonic() - self._counted_at >= self.recount_interval:
+            self._depth, self.running, completed = await asyncio.to_thread(self._count)
+            self._counted_at = time.monotonic()
+            if self._completed is not None and completed > self._completed:
+                self.service_rate.record(completed - self._completed)
+            self._completed = completed
+
+    def _count(self) -> tuple:
+        now = time.time()
+        with self._lock:
+            depth, running = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(claimed_by IS NOT NULL AND lease_expires >= ?), 0) FROM job_journal", (now,)
+            ).fetchone()
+            completed = self._db.execute("SELECT completed FROM broker_stats").fetchone()[0]
+        return depth, running, completed
+
+    def _write(self, appends: list, checkouts: list, acks: list):
+        super()._write(appends, checkouts, acks)
+        if acks:
+            with self._lock:
+                with self._db:
+                    self._db.execute("UPDATE broker_stats SET completed = completed + ?", (len(acks),))
+
+    def release(self, job_id: str):
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "UPDATE job_journal SET claimed_by = NULL, lease_expires = 0, attempts = MAX(attempts - 1, 0) WHERE id = ?", (job_id,)
+                )
+
+    def claim(self, worker_id: str, limit: int) -> list:
+        now = time.time()
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN IMMEDIATE")
+                self._db.execute(
+                    "DELETE FROM job_journal WHERE attempts >= ? AND (claimed_by IS NULL OR lease_expires < ?)", (self.max_attempts, now)
+                )
+                rows = self._db.execute(
+                    f"SELECT {JOB_COLUMNS} FROM job_journal "
+                    "WHERE (claimed_by IS NULL OR lease_expires < ?) AND not_before <= ? "
+                    "ORDER BY priority, enqueued_at LIMIT ?", (now, now, limit)
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE job_journal SET claimed_by = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                    [(worker_id, now + self.lease, row[0]) for row in rows]
+                )
+        return rows
@@ -2,21 +2,22 @@ import discord
 from discord.ui import Button, Select, View
 
 class RemixButton(Button):
-    def __init__(self, ctx, command_args):
+    def __init__(self):
         emoji = "🌱"
         super().__init__(style=discord.ButtonStyle.secondary, label="ReMix", emoji=emoji, custom_id="remix_button")
-        self.ctx = ctx
-        self.command_args = command_args
 
 class RandomStyleButton(Button):
-    def __init__(self, ctx, command_args):
+    def __init__(self):
         emoji = "🎨"
         super().__init__(style=discord.ButtonStyle.secondary, label="ReStyle", emoji=emoji, custom_id="random_style_button")
-        self.ctx = ctx
-        self.command_args = command_args
+
+class VariationsButton(Button):
+    def __init__(self):
+        emoji = "🔢"
+        super().__init__(style=discord.ButtonStyle.secondary, label="Variations", emoji=emoji, custom_id="variations_button")
 
 class ControlModelSelect(Select):
-    def __init__(self, ctx, command_args):
+    def __init__(self):
         options = [
             discord.SelectOption(label="Canny", value="CANNY", description="Uses canny edge detection for remix"),
             discord.SelectOption(label="Depth", value="DEPTH", description="Uses depth map for remix"),
@@ -25,11 +26,9 @@ class ControlModelSelect(Select):
             discord.SelectOption(label="Pose", value="POSE", description="Uses human pose skeleton for remix")
         ]
         super().__init__(custom_id="control_model_select", options=options, placeholder="Choose how to remix (control model)")
-        self.ctx = ctx
-        self.command_args = command_args
 
 class ModelSelect(Select):
-    def __init__(self, ctx, command_args):
+    def __init__(self):
         options = [
             discord.SelectOption(label="v4_1", value="V4_1"),
             discord.SelectOption(label="v4_beta", value="V4_BETA"),
@@ -47,11 +46,9 @@ class ModelSelect(Select):
             discord.SelectOption(label="rpg", value="RPG")
         ]
         super().__init__(custom_id="model_select", options=options, placeholder="Choose a model to use for the remix")
-        self.ctx = ctx
-        self.command_args = command_args
 
 class StrengthSelect(Select):
-    def __init__(self, ctx, command_args):
+    def __init__(self):
         options = [
             discord.SelectOption(
                 label=str(i),
@@ -63,16 +60,30 @@ class StrengthSelect(Select):
             for i in range(0, 101, 10)
         ]
         super().__init__(custom_id="strength_select", options=options, placeholder="Set original image strength (0-100)")
-        self.ctx = ctx
-        self.command_args = command_args
 
 
 class RemixMenu(View):
-    def __init__(self, ctx, command_args):
-        super().__init__()
-        self.add_item(ControlModelSelect(ctx, command_args))
-        self.add_item(ModelSelect(ctx, command_args))
-        self.add_item(StrengthSelect(ctx, command_args))
-        self.add_item(RemixButton(ctx, command_args))
-        self.add_item(RandomStyleButton(ctx, command_args))
+    def __init__(self):
+        super().__init__(timeout=None)
+        self.add_item(ControlModelSelect())
+        self.add_item(ModelSelect())
+        self.add_item(StrengthSelect())
+        self.add_item(RemixButton())
+        self.add_item(RandomStyleButton())
+        self.add_item(VariationsButton())
+
+
+class VariationSelect(Select):
+    def __init__(self, seeds=()):
+        options = [
+            discord.SelectOption(label=f"Variation {i + 1}", value=str(i), description=f"Seed {seed}")
+            for i, seed in enumerate(seeds)
+        ]
+        super().__init__(custom_id="variation_select", options=options, placeholder="Pick a variation to continue from")
+
+
+class VariationMenu(View):
+    def __init__(self, seeds=()):
+        super().__init__(timeout=None)
+        self.add_item(VariationSelect(seeds))
 
@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data or b"").hexdigest()
+
+
+def args_fingerprint(args: dict) -> str:
+    fields = {
+        'prompt': args['prompt'].strip(),
+        'model': args['model'].name,
+        'control': args['control'].name,
+        'negative': args['negative'].strip(),
+        'scale': str(args['scale']),
+        'strength': str(args['strength']),
+        'style': args['style'].name,
+        'seed': str(args['seed']),
+    }
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+
+def result_key(image_hash: str, args: dict) -> str:
+    return hashlib.sha256(f"{image_hash}:{args_fingerprint(args)}".encode()).hexdigest()
+
+
+class LRUCache:
+    def __init__(self, max_size: int, sizeof=len, ttl: float = None):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+            self.pop(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_size:
+            return
+        self.pop(key)
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        self._data[key] = (value, size, expires)
+        self.size += size
+        while self.size > self.max_size:
+            _, (_, evicted, _) = self._data.popitem(last=False)
+            self.size -= evicted
+
+    def pop(self, key, default=None):
+        if key not in self._data:
+            return default
+        value, size, _ = self._data.pop(key)
+        self.size -= size
+        return value
+
+
+class SingleFlight:
+    def __init__(self):
+        self.shared = 0
+        self._calls = {}
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+
+class DiskCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.bytes = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def set(self, key, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        with self._lock:
+            if os.path.exists(path):
+                self.bytes -= os.path.getsize(path)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+            self.bytes += len(value)
+            if self.bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted((entry for entry in os.scandir(self.directory) if entry.is_file()), key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self.bytes <= self.max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self.bytes -= size
+
+
+class ResultCache:
+    def __init__(self, memory_bytes: int, directory: str = None, disk_bytes: int = 0):
+        self.memory = LRUCache(memory_bytes)
+        self.disk = DiskCache(directory, disk_bytes) if directory else None
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk:
+            value = await asyncio.to_thread(self.disk.get, key)
+            if value is not None:
+                self.memory.set(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key, value: bytes):
+        self.memory.set(key, value)
+        if self.disk:
+            await asyncio.to_thread(self.disk.set, key, value)
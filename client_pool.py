@@ -0,0 +1,63 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+
+import httpx
+from imaginepy import AsyncImagine
+
+
+class ImaginePool:
+    def __init__(self, size: int, factory=AsyncImagine):
+        self.size = size
+        self.factory = factory
+        self.created = 0
+        self.recycled = 0
+        self._idle = deque()
+        self._slots = None
+        self._closed = False
+
+    def _checkout(self):
+        if self._idle:
+            return self._idle.pop()
+        self.created += 1
+        return self.factory()
+
+    @asynccontextmanager
+    async def client(self):
+        if self._closed:
+            raise RuntimeError("ImaginePool is closed")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        async with self._slots:
+            imagine = self._checkout()
+            try:
+                yield imagine
+            except (httpx.TransportError, RuntimeError):
+                await self.discard(imagine)
+                raise
+            except BaseException:
+                self._checkin(imagine)
+                raise
+            else:
+                self._checkin(imagine)
+
+    def _checkin(self, imagine):
+        if self._closed:
+            asyncio.get_running_loop().create_task(self._close(imagine))
+        else:
+            self._idle.append(imagine)
+
+    async def discard(self, imagine):
+        self.recycled += 1
+        await self._close(imagine)
+
+    async def _close(self, imagine):
+        try:
+            await imagine.close()
+        except Exception:
+            pass
+
+    async def close(self):
+        self._closed = True
+        while self._idle:
+            await self._close(self._idle.pop())
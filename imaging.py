@@ -0,0 +1,101 @@
+import io
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from PIL import Image, ImageDraw, ImageOps
+
+
+METADATA_KEYS = ('exif', 'icc_profile', 'xmp', 'XML:com.adobe.xmp', 'comment', 'photoshop')
+OUTPUT_FORMATS = {'png': ('PNG', 'png'), 'webp': ('WEBP', 'webp'), 'jpeg': ('JPEG', 'jpg'), 'jpg': ('JPEG', 'jpg')}
+
+
+def make_executor(kind: str, workers: int):
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="imaging")
+
+
+class StepTimer:
+    def __init__(self):
+        self.steps = {}
+        self._last = time.perf_counter()
+
+    def mark(self, step: str):
+        now = time.perf_counter()
+        self.steps[step] = (now - self._last) * 1000
+        self._last = now
+
+
+def prepare_upload(data: bytes, max_side: int):
+    timer = StepTimer()
+    image = Image.open(io.BytesIO(data))
+    source_format = image.format
+    image.load()
+    timer.mark('decode')
+    exif = image.getexif()
+    changed = exif.get(0x0112, 1) != 1
+    has_metadata = bool(exif) or bool(getattr(image, 'text', None)) or any(key in image.info for key in METADATA_KEYS)
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        changed = True
+    timer.mark('resize')
+    buffer = io.BytesIO()
+    if source_format == 'JPEG':
+        image.save(buffer, format='JPEG', quality=95)
+    else:
+        image.save(buffer, format='PNG')
+    timer.mark('encode')
+    if not changed and not has_metadata and buffer.tell() >= len(data):
+        return data, timer.steps
+    return buffer.getvalue(), timer.steps
+
+
+def encode_output(data: bytes, output_format: str, quality: int, target_kb: int):
+    timer = StepTimer()
+    pil_format, extension = OUTPUT_FORMATS[output_format]
+    if pil_format == 'PNG':
+        return data, extension, timer.steps
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    timer.mark('decode')
+    while True:
+        buffer = io.BytesIO()
+        image.save(buffer, format=pil_format, quality=quality)
+        encoded = buffer.getvalue()
+        if not target_kb or len(encoded) <= target_kb * 1024 or quality <= 40:
+            break
+        quality -= 10
+    timer.mark('encode')
+    return encoded, extension, timer.steps
+
+
+def make_grid(images: list, tile_size: int):
+    timer = StepTimer()
+    tiles = []
+    for data in images:
+        tile = Image.open(io.BytesIO(data)).convert('RGB')
+        tile.thumbnail((tile_size, tile_size), Image.LANCZOS)
+        tiles.append(tile)
+    timer.mark('decode')
+    columns = math.ceil(math.sqrt(len(tiles)))
+    rows = math.ceil(len(tiles) / columns)
+    cell_width = max(tile.width for tile in tiles)
+    cell_height = max(tile.height for tile in tiles)
+    grid = Image.new('RGB', (columns * cell_width, rows * cell_height), (0, 0, 0))
+    draw = ImageDraw.Draw(grid)
+    for index, tile in enumerate(tiles):
+        x, y = (index % columns) * cell_width, (index // columns) * cell_height
+        grid.paste(tile, (x, y))
+        draw.rectangle((x + 4, y + 4, x + 28, y + 24), fill=(0, 0, 0))
+        draw.text((x + 10, y + 8), str(index + 1), fill=(255, 255, 255))
+    timer.mark('compose')
+    buffer = io.BytesIO()
+    grid.save(buffer, format='PNG')
+    timer.mark('encode')
+    return buffer.getvalue(), timer.steps
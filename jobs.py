@@ -0,0 +1,146 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+from imaginepy import Mode, Model, Style
+
+from cache import LRUCache, args_fingerprint
+
+
+class JobRecord:
+    __slots__ = ('prompt', 'model', 'control', 'negative', 'scale', 'strength', 'style', 'seed', 'source_message_id', 'seeds')
+
+    def __init__(self, prompt: str, model: str, control: str, negative: str, scale: float, strength: int, style: str, seed: str, source_message_id: int, seeds: tuple = None):
+        self.prompt = prompt
+        self.model = model
+        self.control = control
+        self.negative = negative
+        self.scale = scale
+        self.strength = strength
+        self.style = style
+        self.seed = seed
+        self.source_message_id = source_message_id
+        self.seeds = seeds
+
+    @classmethod
+    def from_args(cls, args: dict, source_message_id: int, seeds: list = None):
+        return cls(args['prompt'], args['model'].name, args['control'].name, args['negative'], args['scale'], args['strength'], args['style'].name, str(args['seed']), source_message_id, tuple(seeds) if seeds else None)
+
+    def to_args(self) -> dict:
+        return {
+            'prompt': self.prompt,
+            'model': Model[self.model],
+            'control': Mode[self.control],
+            'negative': self.negative,
+            'scale': self.scale,
+            'strength': self.strength,
+            'style': Style[self.style],
+            'seed': self.seed,
+            'count': 1,
+        }
+
+    def to_row(self) -> tuple:
+        row = tuple(getattr(self, field) for field in self.__slots__)
+        return row[:-1] + (",".join(self.seeds) if self.seeds else None,)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row[:-1], tuple(row[-1].split(",")) if row[-1] else None)
+
+
+class RemixJob:
+    __slots__ = ('id', 'kind', 'channel_id', 'guild_id', 'author_id', 'author_name', 'ctx_message_id', 'message_id', 'args', 'key', 'enqueued_at', 'not_before', 'priority', 'ctx', 'author')
+
+    def __init__(self, kind: str, channel_id: int, guild_id: int, author_id: int, author_name: str, ctx_message_id: int, message_id: int, args: dict,
+                 enqueued_at: float = None, not_before: float = 0.0, priority: int = 0, id: str = None):
+        self.id = id or uuid.uuid4().hex
+        self.kind = kind
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.author_id = author_id
+        self.author_name = author_name
+        self.ctx_message_id = ctx_message_id
+        self.message_id = message_id
+        self.args = args
+        self.key = (message_id, args_fingerprint(args), args['count'])
+        self.enqueued_at = enqueued_at or time.time()
+        self.not_before = not_before or 0.0
+        self.priority = priority or 0
+        self.ctx = None
+        self.author = None
+
+    @classmethod
+    def for_context(cls, kind: str, ctx, author, args: dict, message_id: int):
+        job = cls(kind, ctx.channel.id, ctx.guild.id if ctx.guild else None, author.id, author.name, ctx.message.id, message_id, args)
+        job.ctx = ctx
+        job.author = author
+        return job
+
+    def to_row(self) -> tuple:
+        args = json.dumps([*JobRecord.from_args(self.args, self.message_id).to_row(), self.args['count']])
+        return (self.id, self.kind, self.channel_id, self.guild_id, self.author_id, self.author_name, self.ctx_message_id, self.message_id, args, self.enqueued_at, self.not_before, self.priority)
+
+    @classmethod
+    def from_row(cls, row):
+        id, kind, channel_id, guild_id, author_id, author_name, ctx_message_id, message_id, args, enqueued_at, not_before, priority = row
+        values = json.loads(args)
+        parsed = JobRecord.from_row(values[:-1]).to_args()
+        parsed['count'] = values[-1]
+        return cls(kind, channel_id, guild_id, author_id, author_name, ctx_message_id, message_id, parsed, enqueued_at, not_before, priority, id)
+
+
+class JobStore:
+    def __init__(self, path: str = None, max_entries: int = 10000):
+        self.memory = LRUCache(max_entries, sizeof=lambda record: 1)
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS job_records ("
+                "message_id INTEGER PRIMARY KEY, prompt TEXT, model TEXT, control TEXT, negative TEXT, "
+                "scale REAL, strength INTEGER, style TEXT, seed TEXT, source_message_id INTEGER, seeds TEXT)"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(job_records)")}
+            if 'seeds' not in columns:
+                self._db.execute("ALTER TABLE job_records ADD COLUMN seeds TEXT")
+            self._db.commit()
+
+    async def put(self, message_id: int, record: JobRecord):
+        self.memory.set(message_id, record)
+        if self._db:
+            await asyncio.to_thread(self._write, message_id, record)
+
+    async def get(self, message_id: int):
+        record = self.memory.get(message_id)
+        if record is None and self._db:
+            record = await asyncio.to_thread(self._read, message_id)
+            if record is not None:
+                self.memory.set(message_id, record)
+        return record
+
+    def _write(self, message_id: int, record: JobRecord):
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO job_records (message_id, {', '.join(JobRecord.__slots__)}) "
+                f"VALUES ({', '.join('?' * (len(JobRecord.__slots__) + 1))})", (message_id, *record.to_row())
+            )
+            self._db.commit()
+
+    def _read(self, message_id: int):
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(JobRecord.__slots__)} FROM job_records WHERE message_id = ?", (message_id,)
+            ).fetchone()
+        return JobRecord.from_row(row) if row else None
+
+    def close(self):
+        if self._db:
+            with self._lock:
+                self._db.close()
+            self._db = None
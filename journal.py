@@ -0,0 +1,120 @@
+import asyncio
+import sqlite3
+import threading
+
+from colorama import Fore
+from colorama import Style as s
+
+
+JOB_COLUMNS = "id, kind, channel_id, guild_id, author_id, author_name, ctx_message_id, message_id, args, enqueued_at, not_before, priority"
+EXTRA_COLUMNS = {'author_name': "TEXT", 'not_before': "REAL DEFAULT 0", 'claimed_by': "TEXT", 'lease_expires': "REAL DEFAULT 0", 'priority': "INTEGER DEFAULT 0"}
+
+
+class JobJournal:
+    def __init__(self, path: str = None, flush_interval: float = 0.05, batch_size: int = 100, max_attempts: int = 3):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._appends = {}
+        self._checkouts = set()
+        self._acks = set()
+        self._lock = threading.Lock()
+        self._wakeup = None
+        self._flusher = None
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS job_journal ("
+                "id TEXT PRIMARY KEY, kind TEXT, channel_id INTEGER, guild_id INTEGER, author_id INTEGER, "
+                "ctx_message_id INTEGER, message_id INTEGER, args TEXT, enqueued_at REAL, attempts INTEGER DEFAULT 0)"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(job_journal)")}
+            for column, definition in EXTRA_COLUMNS.items():
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE job_journal ADD COLUMN {column} {definition}")
+            self._db.commit()
+
+    def start(self):
+        if self._db and self._flusher is None:
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.get_running_loop().create_task(self._run())
+
+    def append(self, job):
+        if not self._db:
+            return
+        self._appends[job.id] = job.to_row()
+        if len(self._appends) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def checkout(self, job_id: str):
+        if self._db:
+            self._checkouts.add(job_id)
+
+    def ack(self, job_id: str):
+        if not self._db:
+            return
+        self._checkouts.discard(job_id)
+        if self._appends.pop(job_id, None) is None:
+            self._acks.add(job_id)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                print(f"{Fore.RED}{s.BRIGHT}Journal flush failed: {e}. Retrying on the next flush{s.RESET_ALL}")
+
+    async def flush(self):
+        if not (self._appends or self._checkouts or self._acks):
+            return
+        appends, checkouts, acks = self._appends, self._checkouts, self._acks
+        self._appends, self._checkouts, self._acks = {}, set(), set()
+        try:
+            await asyncio.to_thread(self._write, list(appends.values()), list(checkouts), list(acks))
+        except sqlite3.Error:
+            self._requeue(appends, checkouts, acks)
+            raise
+
+    def _requeue(self, appends: dict, checkouts: set, acks: set):
+        for job_id, row in appends.items():
+            if job_id in self._acks:
+                self._acks.discard(job_id)
+                checkouts.discard(job_id)
+            else:
+                self._appends.setdefault(job_id, row)
+        self._checkouts |= checkouts - self._acks
+        self._acks |= acks
+
+    def _write(self, appends: list, checkouts: list, acks: list):
+        with self._lock:
+            with self._db:
+                self._db.executemany(f"INSERT OR REPLACE INTO job_journal ({JOB_COLUMNS}) VALUES ({', '.join('?' * len(JOB_COLUMNS.split(', ')))})", appends)
+                self._db.executemany("UPDATE job_journal SET attempts = attempts + 1 WHERE id = ?", [(job_id,) for job_id in checkouts])
+                self._db.executemany("DELETE FROM job_journal WHERE id = ?", [(job_id,) for job_id in acks])
+
+    def pending(self) -> tuple:
+        if not self._db:
+            return [], []
+        with self._lock:
+            rows = self._db.execute(f"SELECT {JOB_COLUMNS}, attempts FROM job_journal ORDER BY enqueued_at").fetchall()
+        replay = [row[:-1] for row in rows if row[-1] < self.max_attempts]
+        abandoned = [row[0] for row in rows if row[-1] >= self.max_attempts]
+        return replay, abandoned
+
+    async def close(self):
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        if self._db:
+            await self.flush()
+            with self._lock:
+                self._db.close()
+            self._db = None
@@ -3,6 +3,9 @@ import io
 import os
 import random
 import re
+import socket
+import sqlite3
+import time
 
 import discord
 import httpx
@@ -12,15 +15,146 @@ from discord import Activity, ActivityType, Embed, File
 from discord.ext import commands
 
 from dotenv import load_dotenv
-from imaginepy import AsyncImagine, Mode, Model, Style, utils
-from buttons import RemixMenu
+from imaginepy import Mode, Model, Style, utils
+from broker import LocalBroker
+from buttons import RemixMenu, VariationMenu
+from cache import LRUCache, ResultCache, SingleFlight, content_hash, result_key
+from client_pool import ImaginePool
+from imaging import encode_output, make_executor, make_grid, prepare_upload
+import metrics
+from jobs import JobRecord, JobStore, RemixJob
+from journal import JobJournal
+from resilience import CircuitBreaker, CircuitOpenError, Upstream
+from scheduler import Coalescer, FairQueue, RateLimiter, ServiceRate
+
+
+started_at = time.monotonic()
+ready_at = None
+load_dotenv()
 
 
-load_dotenv()
-bot = commands.Bot(command_prefix='!', intents=discord.Intents.all())
+class RemixBot(commands.Bot):
+    metrics_server = None
+
+    async def setup_hook(self):
+        self.add_view(RemixMenu())
+        self.add_view(VariationMenu())
+        journal.start()
+        if metrics_port:
+            self.metrics_server = await metrics.serve(metrics_host, metrics_port)
+            print(f"{Fore.CYAN}Serving metrics on http://{metrics_host}:{metrics_port}/metrics{s.RESET_ALL}")
+
+    async def close(self):
+        if self.metrics_server:
+            self.metrics_server.close()
+        await imagine_pool.close()
+        await journal.close()
+        job_store.close()
+        image_executor.shutdown(wait=False)
+        await super().close()
+
+
+gateway_profile = os.environ.get("GATEWAY_PROFILE", "lean").lower()
+if gateway_profile == "full":
+    bot = RemixBot(command_prefix='!', intents=discord.Intents.all())
+else:
+    intents = discord.Intents.none()
+    intents.guilds = intents.guild_messages = intents.dm_messages = intents.message_content = True
+    bot = RemixBot(
+        command_prefix='!', intents=intents,
+        member_cache_flags=discord.MemberCacheFlags.none(),
+        chunk_guilds_at_startup=False,
+        max_messages=int(os.environ.get("GATEWAY_MAX_MESSAGES", 200)) or None,
+    )
 bot.remove_command('help')
-task_queue = asyncio.Queue()
-queue_counter = 0
+worker_count = int(os.environ.get("WORKER_COUNT", 3))
+imagine_pool = ImaginePool(size=int(os.environ.get("IMAGINE_POOL_SIZE", worker_count)))
+hedge_requests = os.environ.get("HEDGE_REQUESTS", "false").lower() in ("1", "true", "yes")
+controlnet_upstream = Upstream(
+    "controlnet", imagine_pool,
+    timeout=float(os.environ.get("UPSTREAM_TIMEOUT", 15)),
+    min_timeout=float(os.environ.get("UPSTREAM_MIN_TIMEOUT", 5)),
+    max_timeout=float(os.environ.get("UPSTREAM_MAX_TIMEOUT", 30)),
+    max_attempts=int(os.environ.get("UPSTREAM_MAX_ATTEMPTS", 3)),
+    hedge=hedge_requests,
+    breaker=CircuitBreaker(int(os.environ.get("BREAKER_FAILURES", 5)), float(os.environ.get("BREAKER_RESET", 30))),
+)
+interrogator_upstream = Upstream(
+    "interrogator", imagine_pool,
+    timeout=float(os.environ.get("INTERROGATOR_TIMEOUT", 10)),
+    min_timeout=3,
+    max_timeout=float(os.environ.get("INTERROGATOR_TIMEOUT", 10)),
+    max_attempts=1,
+    hedge=hedge_requests,
+    breaker=CircuitBreaker(int(os.environ.get("BREAKER_FAILURES", 5)), float(os.environ.get("BREAKER_RESET", 30))),
+)
+result_cache = ResultCache(
+    memory_bytes=int(os.environ.get("RESULT_CACHE_MB", 64)) * 1024 * 1024,
+    directory=os.environ.get("RESULT_CACHE_DIR") or None,
+    disk_bytes=int(os.environ.get("RESULT_CACHE_DISK_MB", 512)) * 1024 * 1024,
+)
+source_cache_ttl = float(os.environ.get("SOURCE_CACHE_TTL", 3600))
+attachment_cache = LRUCache(int(os.environ.get("ATTACHMENT_CACHE_MB", 128)) * 1024 * 1024, ttl=source_cache_ttl)
+message_cache = LRUCache(int(os.environ.get("MESSAGE_CACHE_ENTRIES", 1000)), sizeof=lambda message: 1, ttl=source_cache_ttl)
+fetch_flight = SingleFlight()
+caption_cache = LRUCache(int(os.environ.get("CAPTION_CACHE_ENTRIES", 5000)), sizeof=lambda caption: 1)
+interrogation_flight = SingleFlight()
+upload_max_side = int(os.environ.get("UPLOAD_MAX_SIDE", 1024))
+output_format = os.environ.get("OUTPUT_FORMAT", "png").lower()
+output_quality = int(os.environ.get("OUTPUT_QUALITY", 90))
+output_target_kb = int(os.environ.get("OUTPUT_TARGET_KB", 0))
+max_variations = int(os.environ.get("MAX_VARIATIONS", 9))
+variation_count = int(os.environ.get("VARIATION_COUNT", 4))
+variation_concurrency = int(os.environ.get("VARIATION_CONCURRENCY", 2))
+variation_tile_size = int(os.environ.get("VARIATION_TILE_SIZE", 512))
+image_executor = make_executor(os.environ.get("IMAGE_EXECUTOR", "thread"), int(os.environ.get("IMAGE_WORKERS", 2)))
+metrics.gauge("remix_queue_depth", "Remix jobs waiting in the queue", function=lambda: journal.depth - journal.running if bot_mode == "gateway" else task_queue.qsize())
+metrics.gauge("remix_jobs_running", "Remix jobs currently being processed by a worker", function=lambda: journal.running if bot_mode == "gateway" else task_queue.in_flight)
+metrics.counter("remix_jobs_coalesced_total", "Remix jobs attached to an identical queued or running job", function=lambda: coalescer.coalesced)
+metrics.counter("remix_jobs_leading_total", "Remix jobs that were rendered on behalf of themselves and any coalesced duplicates", function=lambda: coalescer.leaders)
+metrics.counter("remix_result_cache_hits_total", "Result cache hits", function=lambda: result_cache.hits)
+metrics.counter("remix_result_cache_misses_total", "Result cache misses", function=lambda: result_cache.misses)
+metrics.counter("remix_attachment_cache_hits_total", "Source attachment cache hits", function=lambda: attachment_cache.hits)
+metrics.counter("remix_caption_cache_hits_total", "Interrogation caption cache hits", function=lambda: caption_cache.hits)
+metrics.counter("remix_fetch_shared_total", "Message and attachment fetches that joined an identical in-flight fetch", function=lambda: fetch_flight.shared)
+metrics.counter("remix_interrogation_shared_total", "Interrogations that joined an identical in-flight interrogation", function=lambda: interrogation_flight.shared)
+metrics.counter("remix_imagine_clients_created_total", "AsyncImagine clients created by the pool", function=lambda: imagine_pool.created)
+metrics.counter("remix_imagine_clients_recycled_total", "AsyncImagine clients discarded after a transport error", function=lambda: imagine_pool.recycled)
+bot_mode = os.environ.get("BOT_MODE", "all").lower()
+if bot_mode not in ("all", "gateway", "worker"):
+    raise SystemExit(f"Unknown BOT_MODE {bot_mode!r}, expected all, gateway or worker")
+state_db = os.environ.get("STATE_DB", "bot_state.sqlite3")
+broker_db = os.environ.get("BROKER_DB") or state_db
+job_store = JobStore(state_db if bot_mode == "all" else broker_db, max_entries=int(os.environ.get("JOB_STORE_ENTRIES", 10000)))
+if bot_mode == "all":
+    journal = JobJournal(
+        state_db,
+        flush_interval=float(os.environ.get("JOURNAL_FLUSH_MS", 50)) / 1000,
+        max_attempts=int(os.environ.get("JOURNAL_MAX_ATTEMPTS", 3)),
+    )
+else:
+    journal = LocalBroker(
+        broker_db,
+        flush_interval=float(os.environ.get("JOURNAL_FLUSH_MS", 50)) / 1000,
+        max_attempts=int(os.environ.get("JOURNAL_MAX_ATTEMPTS", 3)),
+        lease=float(os.environ.get("JOB_LEASE_SECONDS", 600)),
+    )
+worker_name = os.environ.get("WORKER_NAME") or f"{socket.gethostname()}-{os.getpid()}"
+broker_poll_interval = float(os.environ.get("BROKER_POLL_MS", 500)) / 1000
+task_queue = FairQueue(maxsize=int(os.environ.get("MAX_QUEUE_SIZE", 100)))
+workers = []
+coalescer = Coalescer()
+service_rate = ServiceRate()
+priority_classes = {
+    'command': int(os.environ.get("PRIORITY_COMMAND", 0)),
+    'button': int(os.environ.get("PRIORITY_BUTTON", 1)),
+    'variations': int(os.environ.get("PRIORITY_VARIATIONS", 2)),
+}
+user_limiter = RateLimiter(float(os.environ.get("USER_RATE_PER_MINUTE", 6)), float(os.environ.get("USER_BURST", 3)))
+guild_limiter = RateLimiter(float(os.environ.get("GUILD_RATE_PER_MINUTE", 30)), float(os.environ.get("GUILD_BURST", 10)))
+max_throttle_delay = float(os.environ.get("MAX_THROTTLE_DELAY", 60))
+metrics_host = os.environ.get("METRICS_HOST", "127.0.0.1")
+metrics_port = int(os.environ.get("METRICS_PORT", 9108))
 default_negative = os.environ.get("DEFAULT_NEGATIVE", "glitch,deformed,lowres,bad anatomy,bad hands,text,error,missing fingers,cropped,jpeg artifacts,signature,watermark,username,blurry")
 
 def parse_arguments(command_args: str):
@@ -33,7 +167,8 @@ def parse_arguments(command_args: str):
         'scale': 7.5,
         'control': Mode.CANNY,
         'style': Style.NO_STYLE,
-        'seed': random_seed()
+        'seed': random_seed(),
+        'count': 1
     }
     current_key = 'prompt'
     for arg in args:
@@ -54,20 +189,34 @@ def parse_arguments(command_args: str):
                 model_str = arg.lower()
                 if model_str == "random":
                     parsed_args[current_key] = random_model()
-                else:
+                elif model_str.upper() in Model.__members__:
                     parsed_args[current_key] = Model[model_str.upper()]
+                else:
+                    raise ValueError(f"Unknown model: {arg}. Use `!styles` to list the available models")
             elif current_key == 'control':
                 control_str = arg.lower()
                 if control_str == "random":
                     parsed_args[current_key] = random_control()
-                else:
+                elif control_str.upper() in Mode.__members__:
                     parsed_args[current_key] = Mode[control_str.upper()]
+                else:
+                    raise ValueError(f"Unknown control: {arg}. Available: {', '.join(mode.name.lower() for mode in Mode)}")
             elif current_key == 'style':
                 style_str = arg.lower()
                 if style_str == "random":
                     parsed_args[current_key] = random_style()
-                else:
+                elif style_str.upper() in Style.__members__:
                     parsed_args[current_key] = Style[style_str.upper()]
+                else:
+                    raise ValueError(f"Unknown style: {arg}. Use `!styles` to list the available styles")
+            elif current_key == 'count':
+                try:
+                    count = int(arg)
+                except ValueError:
+                    count = 0
+                if not 1 <= count <= max_variations:
+                    raise ValueError(f"Invalid count. Must be an integer between 1-{max_variations}")
+                parsed_args[current_key] = count
             elif current_key == 'seed':
                 try:
                     parsed_args[current_key] = int(arg)
@@ -112,6 +261,77 @@ def get_args(message_content: str, embed_field_values: dict, embed_footer_text:
     return args
 
 
+async def fetch_message_cached(channel, message_id: int):
+    message = message_cache.get(message_id)
+    if message is None:
+        message = await fetch_flight.do(('message', message_id), lambda: channel.fetch_message(message_id))
+        message_cache.set(message_id, message)
+    return message
+
+
+async def read_attachment_cached(message):
+    if not message.attachments:
+        return None
+    image = attachment_cache.get(message.id)
+    if image is None:
+        image = await fetch_flight.do(('attachment', message.id), lambda: download_source_image(message.attachments[0]))
+        attachment_cache.set(message.id, image)
+    return image
+
+
+async def run_image_task(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(image_executor, func, *args)
+
+
+def print_image_steps(label: str, before: int, after: int, steps: dict):
+    timings = ", ".join(f"{step} {ms:.0f}ms" for step, ms in steps.items())
+    print(f"{Fore.CYAN}{label}: {before / 1024:.0f}KB -> {after / 1024:.0f}KB ({timings}){s.RESET_ALL}")
+
+
+async def download_source_image(attachment):
+    with metrics.stage_seconds.time(stage="attachment_download"):
+        data = await attachment.read()
+    try:
+        prepared, steps = await run_image_task(prepare_upload, data, upload_max_side)
+    except Exception as e:
+        print(f"{Fore.RED}{s.DIM}Could not preprocess {attachment.filename}: {e}. Uploading as-is{s.RESET_ALL}")
+        return data
+    metrics.stage_seconds.observe(sum(steps.values()) / 1000, stage="preprocess")
+    print_image_steps("Preprocessed source image", len(data), len(prepared), steps)
+    return prepared
+
+
+async def encode_result(remixed_image: bytes):
+    try:
+        output, extension, steps = await run_image_task(encode_output, remixed_image, output_format, output_quality, output_target_kb)
+    except Exception as e:
+        print(f"{Fore.RED}{s.DIM}Could not encode result as {output_format}: {e}. Sending PNG{s.RESET_ALL}")
+        return remixed_image, "remixed_image.png"
+    if steps:
+        metrics.stage_seconds.observe(sum(steps.values()) / 1000, stage="encode")
+        print_image_steps(f"Encoded result as {output_format}", len(remixed_image), len(output), steps)
+    return output, f"remixed_image.{extension}"
+
+
+async def interrogate(image: bytes, image_hash: str):
+    caption = caption_cache.get(image_hash)
+    if caption is None:
+        caption = await interrogation_flight.do(image_hash, lambda: interrogate_upstream(image))
+        if caption is not None:
+            caption_cache.set(image_hash, caption)
+    return caption
+
+
+async def interrogate_upstream(image: bytes):
+    print(f"{Fore.WHITE}{Back.MAGENTA}No prompt found. Interrogating Image...{s.RESET_ALL}")
+    try:
+        generated_prompt = await interrogator_upstream.call(lambda imagine: imagine.interrogator(content=image))
+    except Exception as e:
+        print(f"{Fore.RED}{s.DIM}Interrogation failed ({type(e).__name__}: {e}). Using fallback prompt{s.RESET_ALL}")
+        return None
+    return generated_prompt.split(',', 1)[0]
+
+
 def random_model():
     return random.choice(list(Model))
 def random_control():
@@ -132,27 +352,175 @@ def get_style_name(style_str):
         return 'no_style'
 
 
-async def queue():
-    global queue_counter
+async def queue(worker_id: int):
     while True:
-        task = await task_queue.get()
-        func, ctx, args = task
+        job = await task_queue.get()
+        metrics.queue_wait.observe(time.time() - job.enqueued_at)
+        journal.checkout(job.id)
         try:
-            await func(ctx, *args)
+            await queue_remix(job)
         except Exception as e:
-            print(f"{Fore.RED}{s.BRIGHT}Error processing task: {e}{s.RESET_ALL}")
+            metrics.job_failures.inc(exception=type(e).__name__)
+            print(f"{Fore.RED}{s.BRIGHT}Worker {worker_id} error processing task: {e}{s.RESET_ALL}")
         finally:
             task_queue.task_done()
-            queue_counter -= 1
+            service_rate.record()
+
+
+def start_workers():
+    while len(workers) < worker_count:
+        workers.append(asyncio.get_running_loop().create_task(queue(len(workers))))
+
+
+def enqueue_remix(ctx, author, args: dict, message_id, kind: str):
+    return enqueue_job(RemixJob.for_context(kind, ctx, author, args, message_id))
+
+
+def enqueue_job(job: RemixJob, rate_limit: bool = True, persist: bool = True, bounded: bool = True):
+    count = job.args['count']
+    delay = 0.0
+    if rate_limit:
+        delay = max(user_limiter.delay(job.author_id, count), guild_limiter.delay(job.guild_id, count))
+        if delay > max_throttle_delay:
+            metrics.jobs.inc(outcome="rejected")
+            print(f"{Fore.RED}{s.BRIGHT}Rate limit exceeded. Rejected job from {job.author.name}{s.RESET_ALL}")
+            return f"You're remixing too fast, please try again in {max(1, round(delay - max_throttle_delay))}s."
+    if bot_mode != "gateway" and coalescer.attach(job.key, job):
+        if rate_limit:
+            reserve_rate(job)
+        if persist:
+            journal.append(job)
+        metrics.jobs.inc(outcome="coalesced")
+        print(f"{Fore.BLUE}{s.BRIGHT}Coalesced duplicate job from {job.author.name} ({coalescer.coalesced} coalesced so far){s.RESET_ALL}")
+        return None
+    if bot_mode == "gateway":
+        full = task_queue.maxsize > 0 and journal.depth >= task_queue.maxsize
+    else:
+        full = task_queue.full()
+    if full and bounded:
+        coalescer.release(job.key)
+        metrics.jobs.inc(outcome="rejected")
+        print(f"{Fore.RED}{s.BRIGHT}Queue is full. Rejected job from {job.author.name}{s.RESET_ALL}")
+        return "The queue is full right now, please try again in a moment."
+    if rate_limit:
+        reserve_rate(job)
+    priority = priority_classes['variations' if count > 1 else job.kind]
+    job.priority = priority
+    if bot_mode == "gateway":
+        job.not_before = time.time() + delay
+        journal.append(job)
+        position = journal.depth
+        print(f"{Fore.BLUE}{s.BRIGHT}Broker queue size: {position}{s.RESET_ALL}")
+    else:
+        position = task_queue.put_nowait(job, job.author_id, job.guild_id, priority, time.monotonic() + delay, bounded)
+        if persist:
+            journal.append(job)
+        print(f"{Fore.BLUE}{s.BRIGHT}Queue size: {task_queue.qsize()} waiting, {task_queue.in_flight} running{s.RESET_ALL}")
+    if delay > 0:
+        metrics.jobs_throttled.inc()
+        return f"You're remixing faster than the rate limit allows. Your job is #{position} in the queue and should start {queue_eta(position, delay)}."
+    return None
+
+
+def reserve_rate(job: RemixJob):
+    user_limiter.reserve(job.author_id, job.args['count'])
+    guild_limiter.reserve(job.guild_id, job.args['count'])
+
+
+async def replay_journal():
+    rows, abandoned = await asyncio.to_thread(journal.pending)
+    for job_id in abandoned:
+        print(f"{Fore.RED}{s.BRIGHT}Dropping job {job_id} after {journal.max_attempts} failed attempts{s.RESET_ALL}")
+        journal.ack(job_id)
+    for row in rows:
+        try:
+            job = RemixJob.from_row(row)
+            channel = bot.get_channel(job.channel_id) or await bot.fetch_channel(job.channel_id)
+            job.ctx = await bot.get_context(await channel.fetch_message(job.ctx_message_id))
+            job.author = bot.get_user(job.author_id) or await bot.fetch_user(job.author_id)
+        except Exception as e:
+            print(f"{Fore.RED}{s.BRIGHT}Could not restore job {row[0]}: {type(e).__name__}: {e}{s.RESET_ALL}")
+            journal.ack(row[0])
+            continue
+        if job.kind == 'button':
+            job.ctx.interaction_user = job.author
+        enqueue_job(job, rate_limit=False, persist=False, bounded=False)
+    if rows:
+        print(f"{Fore.CYAN}Replayed {len(rows)} queued jobs from the journal{s.RESET_ALL}")
+
+
+class RestContext:
+    def __init__(self, channel, guild_id: int):
+        self.channel = channel
+        self.guild = discord.Object(guild_id) if guild_id else None
+
+    async def send(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
 
 
-async def remix_from_interaction(interaction: discord.Interaction, command_args: str, interaction_user: discord.User, message_id):
+class RestUser:
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.name = name or str(user_id)
+        self.mention = f"<@{user_id}>"
+
+
+async def claim_jobs():
+    while True:
+        free = worker_count * 2 - task_queue.depth()
+        try:
+            rows = await asyncio.to_thread(journal.claim, worker_name, free) if free > 0 else []
+        except sqlite3.Error as e:
+            print(f"{Fore.RED}{s.BRIGHT}Could not claim jobs from the broker: {e}{s.RESET_ALL}")
+            rows = []
+        for row in rows:
+            try:
+                job = RemixJob.from_row(row)
+            except Exception as e:
+                print(f"{Fore.RED}{s.BRIGHT}Could not restore job {row[0]}: {type(e).__name__}: {e}{s.RESET_ALL}")
+                journal.ack(row[0])
+                continue
+            job.ctx = RestContext(bot.get_partial_messageable(job.channel_id, guild_id=job.guild_id), job.guild_id)
+            job.author = RestUser(job.author_id, job.author_name)
+            if enqueue_job(job, rate_limit=False, persist=False):
+                print(f"{Fore.YELLOW}Local queue is full, returning job {job.id} to the broker{s.RESET_ALL}")
+                await asyncio.to_thread(journal.release, job.id)
+        if not rows:
+            await asyncio.sleep(broker_poll_interval)
+
+
+async def run_worker():
+    async with bot:
+        await bot.login(os.getenv("DISCORD_TOKEN"))
+        print(f"{Fore.CYAN}Render worker {worker_name} logged in as {bot.user}, waiting for jobs{s.RESET_ALL}")
+        report_startup("Render worker ready")
+        start_workers()
+        await claim_jobs()
+
+
+def report_startup(label: str):
+    global ready_at
+    if ready_at is not None:
+        return
+    ready_at = time.monotonic()
+    elapsed = ready_at - started_at
+    metrics.startup_seconds.set(elapsed)
+    print(f"{Fore.CYAN}{label} in {elapsed:.1f}s using {metrics.resident_memory() / 1024 / 1024:.0f}MB RSS "
+          f"({gateway_profile} profile, {len(bot.guilds)} guilds, {len(bot.users)} cached users){s.RESET_ALL}")
+
+
+def queue_eta(position: int, delay: float) -> str:
+    rate = (journal.service_rate if bot_mode == "gateway" else service_rate).per_second()
+    eta = max(delay, position / rate) if rate else delay
+    return f"in about {max(1, round(eta))}s"
+
+
+async def remix_from_interaction(interaction: discord.Interaction, args: dict, interaction_user: discord.User, message_id):
     ctx = await bot.get_context(interaction.message)
     ctx.interaction_user = interaction_user
-    global queue_counter
-    await task_queue.put((queue_remix, ctx, (command_args, message_id)))
-    queue_counter += 1
-    print(f"{Fore.BLUE}{s.BRIGHT}Queue size: {queue_counter}{s.RESET_ALL}")
+    notice = enqueue_remix(ctx, interaction_user, args, message_id, 'button')
+    if notice:
+        await interaction.followup.send(content=notice, ephemeral=True)
 
 
 
@@ -160,7 +528,10 @@ async def remix_from_interaction(interaction: discord.Interaction, command_args:
 async def on_ready():
     print(f"{Fore.CYAN}{bot.user} has connected to Discord!{s.RESET_ALL}")
     await bot.change_presence(activity=Activity(type=ActivityType.watching, name="for !remix + image"))
-    bot.loop.create_task(queue())
+    report_startup("Gateway ready")
+    if bot_mode == "all" and not workers:
+        await replay_journal()
+        start_workers()
 
 
 @bot.command()
@@ -174,65 +545,67 @@ async def styles(ctx):
 async def on_interaction(interaction: discord.Interaction):
     if interaction.type == discord.InteractionType.component:
         await interaction.response.defer(ephemeral=False)
-        channel = interaction.channel
-        bot_message = await channel.fetch_message(interaction.message.id)            
-        message_content = bot_message.content
-        embed_field_values = None
-        image = None
-        
-        if bot_message.embeds:
-            embed_footer_text = bot_message.embeds[0].footer.text
-            embed_fields = bot_message.embeds[0].fields
-            embed_field_values = {field.name: field.value for field in embed_fields}
+        record = await job_store.get(interaction.message.id)
+        if record is not None:
+            args, message_id = record.to_args(), record.source_message_id
         else:
-            print("Error: Embed not found in the message.")
-            return
-        args = get_args(message_content, embed_field_values, embed_footer_text)
-
-        if 'original_image' in args:
-            message_id = int(args['original_image'].split('/')[-1])
-            message = await channel.fetch_message(message_id)
-            if message.attachments:
-                image = message.attachments[0]
-
-        if interaction.data["custom_id"] == "remix_button":
-            await interaction.followup.send(content="Remixing with random seed", ephemeral=True)  
+            try:
+                args, message_id = args_from_message(interaction.message)
+            except (LookupError, ValueError) as e:
+                print(f"Error: Could not recover remix settings from message {interaction.message.id}: {e}")
+                return
+
+        custom_id = interaction.data["custom_id"]
+        if custom_id == "variation_select":
+            index = int(interaction.data["values"][0])
+            if record is None or not record.seeds or index >= len(record.seeds):
+                await interaction.followup.send(content="This variation grid can no longer be used, please remix again.", ephemeral=True)
+                return
+            await interaction.followup.send(content=f"Continuing from variation {index + 1}", ephemeral=True)
+            args['seed'] = record.seeds[index]
+        elif custom_id == "variations_button":
+            await interaction.followup.send(content=f"Rendering {variation_count} variations", ephemeral=True)
             args['seed'] = random_seed()
-            command_args = f"{args['prompt']} --model {args.get('model', 'V3')} --control {args.get('control', 'canny')} --negative {args.get('negative', default_negative)} --scale {args.get('scale', '7.5')} --style {args.get('style', 'no_style')} --strength {args.get('strength', '0')} --seed {args.get('seed', '42')}"
-            await remix_from_interaction(interaction, command_args, interaction.user, message_id)
-
-        elif interaction.data["custom_id"] == "random_style_button":
-            await interaction.followup.send(content="Remixing with random style", ephemeral=True)     
-            args['style'] = random_style().name
-            command_args = f"{args['prompt']} --model {args.get('model', 'V3')} --control {args.get('control', 'canny')} --negative {args.get('negative', default_negative)} --scale {args.get('scale', '7.5')} --style {args.get('style', 'no_style')} --strength {args.get('strength', '0')} --seed {args.get('seed', '42')}"
-            await remix_from_interaction(interaction, command_args, interaction.user, message_id)
-
-        elif interaction.data["custom_id"] == "control_model_select":
+            args['count'] = variation_count
+        elif custom_id == "remix_button":
+            await interaction.followup.send(content="Remixing with random seed", ephemeral=True)
+            args['seed'] = random_seed()
+        elif custom_id == "random_style_button":
+            await interaction.followup.send(content="Remixing with random style", ephemeral=True)
+            args['style'] = random_style()
+        elif custom_id == "control_model_select":
             control_model = interaction.data["values"][0]
             await interaction.followup.send(content=f"Remixing with {control_model} control model", ephemeral=True)
-            args['control'] = Mode[control_model].name
-            command_args = f"{args['prompt']} --model {args.get('model', 'V3')} --control {args.get('control', 'canny')} --negative {args.get('negative', default_negative)} --scale {args.get('scale', '7.5')} --style {args.get('style', 'no_style')} --strength {args.get('strength', '0')} --seed {args.get('seed', '42')}"
-            await remix_from_interaction(interaction, command_args, interaction.user, message_id)
-
-        elif interaction.data["custom_id"] == "model_select":
+            args['control'] = Mode[control_model]
+        elif custom_id == "model_select":
             model = interaction.data["values"][0]
             await interaction.followup.send(content=f"Remixing with {model}", ephemeral=True)
-            args['model'] = Model[model].name
-            command_args = f"{args['prompt']} --model {args.get('model', 'V3')} --control {args.get('control', 'canny')} --negative {args.get('negative', default_negative)} --scale {args.get('scale', '7.5')} --style {args.get('style', 'no_style')} --strength {args.get('strength', '0')} --seed {args.get('seed', '42')}"
-            await remix_from_interaction(interaction, command_args, interaction.user, message_id)
-
-        elif interaction.data["custom_id"] == "strength_select":
+            args['model'] = Model[model]
+        elif custom_id == "strength_select":
             strength = interaction.data["values"][0]
             await interaction.followup.send(content=f"Setting strength to {strength}", ephemeral=True)
-            args['strength'] = strength
-            command_args = f"{args['prompt']} --model {args.get('model', 'V3')} --control {args.get('control', 'canny')} --negative {args.get('negative', default_negative)} --scale {args.get('scale', '7.5')} --style {args.get('style', 'no_style')} --strength {args.get('strength', '0')} --seed {args.get('seed', '42')}"
-            await remix_from_interaction(interaction, command_args, interaction.user, message_id)
+            args['strength'] = utils.get_strength(int(strength))
+        else:
+            return
+        await remix_from_interaction(interaction, args, interaction.user, message_id)
+
+
+def args_from_message(bot_message):
+    if not bot_message.embeds:
+        raise LookupError("embed not found in the message")
+    embed_footer_text = bot_message.embeds[0].footer.text
+    embed_field_values = {field.name: field.value for field in bot_message.embeds[0].fields}
+    args = get_args(bot_message.content, embed_field_values, embed_footer_text)
+    if 'original_image' not in args:
+        raise LookupError("original image link not found in the message")
+    message_id = int(args['original_image'].split('/')[-1])
+    command_args = f"{args['prompt']} --model {args.get('model', 'V3')} --control {args.get('control', 'canny')} --negative {args.get('negative', default_negative)} --scale {args.get('scale', '7.5')} --style {args.get('style', 'no_style')} --strength {args.get('strength', '0')} --seed {args.get('seed', '42')}"
+    return parse_arguments(command_args), message_id
 
 
 
 @bot.command()
 async def remix(ctx, *, command_args: str = ""):
-    global queue_counter
     image = None
     if ctx.message.attachments:
         image = ctx.message.attachments[0]
@@ -249,100 +622,156 @@ async def remix(ctx, *, command_args: str = ""):
         embed.add_field(name="❌ Choose a negative prompt (optional):", value="`--negative ugly`\n", inline=False)
         embed.add_field(name="⚖️ Change the guidance scale. Higher values increase the strength of your prompt. (Range: 0.0-10.0)", value="`--scale 8`\n", inline=False)
         embed.add_field(name="💪 Change the strength of the image to be remixed. Higher values change the image less. (Range: 0-100)", value="`--strength 50`\n", inline=False)
+        embed.add_field(name="🔢 Render several seeds at once as a grid (optional):", value=f"`--count 4` (max {max_variations})\n", inline=False)
         embed.add_field(name="Example", value=f"`!remix cat --control {example_control} --model {example_model} --negative dog --style {example_style} --strength 10 --scale 8 --seed 12345`\n", inline=False)
         embed.add_field(name="", value=f"🔗[Github](https://github.com/coalescentdivide/imaginepy-controlnet-discord-bot/tree/main)", inline=False)
         embed.set_footer(text="Made by Trypsky")
         await ctx.send(embed=embed)
     else:
+        try:
+            args = parse_arguments(command_args)
+        except ValueError as ve:
+            await ctx.send(str(ve))
+            return
         if ctx.message.reference:
             message_id = ctx.message.reference.message_id
+            message_cache.set(message_id, ctx.message.reference.resolved)
         else:
             message_id = ctx.message.id
-        await task_queue.put((queue_remix, ctx, (command_args, message_id)))
-        queue_counter += 1
-        print(f"{Fore.BLUE}{s.BRIGHT}Queue size: {queue_counter}{s.RESET_ALL}")
+            message_cache.set(message_id, ctx.message)
+        notice = enqueue_remix(ctx, ctx.author, args, message_id, 'command')
+        if notice:
+            await ctx.send(notice)
+
+
+async def queue_remix(job: RemixJob):
+    ctx, args, message_id = job.ctx, job.args, job.message_id
+    print(f"{Fore.RED}{s.BRIGHT}{job.author.name}{s.RESET_ALL} is remixing an image")
+    recipients = [job]
+    output = None
+    failure = "Please try again later."
+    try:
+        remixed_image = await render_remix(ctx.channel, args, message_id)
+        if remixed_image is not None:
+            output, filename = await encode_result(remixed_image)
+    except CircuitOpenError as e:
+        metrics.job_failures.inc(exception=type(e).__name__)
+        print(f"{Fore.RED}{s.BRIGHT}{e}. Failing fast{s.RESET_ALL}")
+        failure = f"The image service is having trouble right now, please try again in {max(1, round(e.retry_after))}s."
+    finally:
+        recipients += coalescer.release(job.key)
+        metrics.jobs.inc(outcome="failed" if output is None else "completed")
+        for recipient in recipients:
+            try:
+                if output is None:
+                    await recipient.ctx.send(failure)
+                else:
+                    await send_remix(recipient.ctx, recipient.author, args, message_id, output, filename)
+            except Exception as e:
+                print(f"{Fore.RED}{s.BRIGHT}Failed to reply to {recipient.author.name}: {type(e).__name__}: {e}{s.RESET_ALL}")
+            finally:
+                journal.ack(recipient.id)
 
 
-async def queue_remix(ctx, command_args: str, message_id: int):
-    author = ctx.interaction_user if hasattr(ctx, 'interaction_user') else ctx.author
-    print(f"{Fore.RED}{s.BRIGHT}{author.name}{s.RESET_ALL} is remixing an image")
-    image = None
-    message = await ctx.channel.fetch_message(message_id)
-    if len(message.attachments) > 0:
-        image = await message.attachments[0].read()
-    imagine = AsyncImagine()
+async def render_remix(channel, args: dict, message_id: int):
+    with metrics.stage_seconds.time(stage="message_fetch"):
+        message = await fetch_message_cached(channel, message_id)
+    image = await read_attachment_cached(message)
+    image_hash = content_hash(image)
 
-    MAX_CONNECTION_RETRIES = 3
-    MAX_SESSION_RETRIES = 2
-    BACKOFF_FACTOR = 2
-    session_retries = 0
+    try:
+        if not args['prompt'] and image:
+            with metrics.stage_seconds.time(stage="interrogation"):
+                args['prompt'] = await interrogate(image, image_hash) or "amazing"
+        if args['count'] > 1:
+            remixed_image = await render_variations(image, image_hash, args)
+        else:
+            remixed_image = await render_seed(image, image_hash, args)
+    except CircuitOpenError:
+        raise
+    except httpx.HTTPStatusError as e:
+        metrics.job_failures.inc(exception=type(e).__name__)
+        print(f"{Fore.RED}{s.DIM}Client Response Error {e.response.status_code}: {e.response.text}. Giving up{s.RESET_ALL}")
+        return None
+    except asyncio.TimeoutError as e:
+        metrics.job_failures.inc(exception=type(e).__name__)
+        print(f"{Fore.RED}{s.DIM}Timeout Error: Giving up{s.RESET_ALL}")
+        return None
+    except Exception as e:
+        metrics.job_failures.inc(exception=type(e).__name__)
+        print(type(e), e)
+        return None
+    print(f"{Fore.GREEN}Successfully processed image with the following settings:{s.RESET_ALL}\n"
+          f"{Fore.YELLOW}Prompt: {s.RESET_ALL}{Back.WHITE}{Fore.BLACK}{combined_prompt(args)}{s.RESET_ALL}\n"
+          f"{Fore.YELLOW}Negative: {s.RESET_ALL}{Fore.RED}{args['negative']}{s.RESET_ALL}\n"
+          f"{Fore.YELLOW}Model: {s.RESET_ALL}{args['model'].name}{s.RESET_ALL}\n"
+          f"{Fore.YELLOW}Seed: {s.RESET_ALL}{', '.join(args.get('seeds') or [str(args['seed'])])}\n"
+          f"{Fore.YELLOW}Strength: {s.RESET_ALL}{args['strength']}\n"
+          f"{Fore.YELLOW}Control: {s.RESET_ALL}{args['control'].name}\n"
+          f"{Fore.YELLOW}Style: {s.RESET_ALL}{args['style'].name}")
+    return remixed_image
+
+
+async def render_seed(image: bytes, image_hash: str, args: dict):
+    cache_key = result_key(image_hash, args)
+    remixed_image = await result_cache.get(cache_key)
+    if remixed_image is None:
+        with metrics.stage_seconds.time(stage="controlnet"):
+            remixed_image = await controlnet_upstream.call(lambda imagine: imagine.controlnet(content=image, prompt=args['prompt'], model=args['model'], mode=args['control'], negative=args['negative'], cfg=args['scale'], style=args['style'], strength=args['strength'], seed=args['seed']))
+        await result_cache.set(cache_key, remixed_image)
+    else:
+        print(f"{Fore.CYAN}Result cache hit, skipping upstream call{s.RESET_ALL}")
+    return remixed_image
 
-    while session_retries < MAX_SESSION_RETRIES:
-        connection_retries = 0
-        success = False
 
-        while connection_retries < MAX_CONNECTION_RETRIES:
-            try:
-                args = None
-                try:
-                    args = parse_arguments(command_args)
-                except ValueError as ve:
-                    await ctx.send(str(ve))
-                    return
-                if not args['prompt'] and image:
-                    try:
-                        print(f"{Fore.WHITE}{Back.MAGENTA}No prompt found. Interrogating Image...{s.RESET_ALL}")
-                        generated_prompt = await asyncio.wait_for(imagine.interrogator(content=image), timeout=10)
-                        concise_prompt = generated_prompt.split(',', 1)[0]
-                        args['prompt'] = concise_prompt
-                    except asyncio.TimeoutError:
-                        args['prompt'] = "amazing"
-                remixed_image = await asyncio.wait_for(imagine.controlnet(content=image, prompt=args['prompt'], model=args['model'], mode=args['control'], negative=args['negative'], cfg=args['scale'], style=args['style'], strength=args['strength'], seed=args['seed']), timeout=15)
-                info = f"🧠{author.mention}⚙️`{args['control'].name.lower()}`💾`{args['model'].name.lower()}`⚖️`{args['scale']}`💪`{args['strength']}`🎨`{args['style'].name.lower()}`🌱`{args['seed']}`"
-                combined_prompt = f"{args['prompt']} {args['style'].value[3]}" if args['style'].value[3] is not None else args['prompt']
-                if args['negative'] != default_negative:
-                    prompt = f"{combined_prompt}\n\nNegative Prompt:\n{args['negative']}"
-                else:
-                    prompt = f"\n{combined_prompt}"
-                print(f"{Fore.GREEN}Successfully processed image with the following settings:{s.RESET_ALL}\n"
-                      f"{Fore.YELLOW}Prompt: {s.RESET_ALL}{Back.WHITE}{Fore.BLACK}{combined_prompt}{s.RESET_ALL}\n"
-                      f"{Fore.YELLOW}Negative: {s.RESET_ALL}{Fore.RED}{args['negative']}{s.RESET_ALL}\n"
-                      f"{Fore.YELLOW}Model: {s.RESET_ALL}{args['model'].name}{s.RESET_ALL}\n"
-                      f"{Fore.YELLOW}Seed: {s.RESET_ALL}{args['seed']}\n"
-                      f"{Fore.YELLOW}Strength: {s.RESET_ALL}{args['strength']}\n"
-                      f"{Fore.YELLOW}Control: {s.RESET_ALL}{args['control'].name}\n"
-                      f"{Fore.YELLOW}Style: {s.RESET_ALL}{args['style'].name}")             
-                file = File(fp=io.BytesIO(remixed_image), filename="remixed_image.png")
-                original_image = f"https://discord.com/channels/{ctx.guild.id}/{ctx.channel.id}/{message_id}"
-                embed = Embed()
-                embed.add_field(name="", value=f"[Original]({original_image})", inline=False)
-                embed.set_footer(text=prompt)
-                await ctx.send(content=f"{info}\n\n", file=file, embed=embed, view=RemixMenu(ctx, args))
-                success = True
-                break
-            except httpx.HTTPStatusError as e:
-                print(f"{Fore.RED}{s.DIM}Client Response Error {e.response.status_code}: {e.response.text}. Retrying...{s.RESET_ALL}")
-            except asyncio.TimeoutError:
-                print(f"{Fore.RED}{s.DIM}Timeout Error: Retrying...{s.RESET_ALL}")
-            except Exception as e:
-                print(type(e), e)
-                
-            connection_retries += 1
-            if connection_retries < MAX_CONNECTION_RETRIES:
-                await asyncio.sleep(BACKOFF_FACTOR ** connection_retries)
-        if success:
-            break
+async def render_variations(image: bytes, image_hash: str, args: dict):
+    seeds = [str(args['seed'])] + [random_seed() for _ in range(args['count'] - 1)]
+    slots = asyncio.Semaphore(variation_concurrency)
+
+    async def render_tile(seed):
+        async with slots:
+            return await render_seed(image, image_hash, {**args, 'seed': seed})
+
+    results = await asyncio.gather(*(render_tile(seed) for seed in seeds), return_exceptions=True)
+    tiles = [(seed, result) for seed, result in zip(seeds, results) if not isinstance(result, BaseException)]
+    if not tiles:
+        raise next(result for result in results if isinstance(result, BaseException))
+    grid, steps = await run_image_task(make_grid, [tile for _, tile in tiles], variation_tile_size)
+    metrics.stage_seconds.observe(sum(steps.values()) / 1000, stage="grid")
+    args['seeds'] = [seed for seed, _ in tiles]
+    return grid
 
-        session_retries += 1
-        if session_retries < MAX_SESSION_RETRIES:
-            if imagine:
-                await imagine.close()
-                await asyncio.sleep(BACKOFF_FACTOR ** session_retries)
-                imagine = AsyncImagine()
 
-    if not success:
-        await ctx.send("Please try again later.")
-    if imagine:
-        await imagine.close()
+def combined_prompt(args: dict) -> str:
+    return f"{args['prompt']} {args['style'].value[3]}" if args['style'].value[3] is not None else args['prompt']
 
-bot.run(os.getenv("DISCORD_TOKEN"))
+
+async def send_remix(ctx, author, args: dict, message_id: int, output: bytes, filename: str):
+    seeds = args.get('seeds')
+    if seeds:
+        seed_info = " ".join(f"{index}:`{seed}`" for index, seed in enumerate(seeds, start=1))
+        info = f"🧠{author.mention}⚙️`{args['control'].name.lower()}`💾`{args['model'].name.lower()}`⚖️`{args['scale']}`💪`{args['strength']}`🎨`{args['style'].name.lower()}`🔢`{len(seeds)}` 🌱{seed_info}"
+        view = VariationMenu(seeds)
+    else:
+        info = f"🧠{author.mention}⚙️`{args['control'].name.lower()}`💾`{args['model'].name.lower()}`⚖️`{args['scale']}`💪`{args['strength']}`🎨`{args['style'].name.lower()}`🌱`{args['seed']}`"
+        view = RemixMenu()
+    if args['negative'] != default_negative:
+        prompt = f"{combined_prompt(args)}\n\nNegative Prompt:\n{args['negative']}"
+    else:
+        prompt = f"\n{combined_prompt(args)}"
+    file = File(fp=io.BytesIO(output), filename=filename)
+    # the persistent views from setup_hook handle the clicks, a stopped view is not stored per message
+    view.stop()
+    original_image = f"https://discord.com/channels/{ctx.guild.id}/{ctx.channel.id}/{message_id}"
+    embed = Embed()
+    embed.add_field(name="", value=f"[Original]({original_image})", inline=False)
+    embed.set_footer(text=prompt)
+    with metrics.stage_seconds.time(stage="discord_upload"):
+        result_message = await ctx.send(content=f"{info}\n\n", file=file, embed=embed, view=view)
+    await job_store.put(result_message.id, JobRecord.from_args(args, message_id, seeds))
+
+if __name__ == "__main__":
+    if bot_mode == "worker":
+        asyncio.run(run_worker())
+    else:
+        bot.run(os.getenv("DISCORD_TOKEN"))
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30, 60, 120)
+
+
+def _format_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple((name, str(labels.get(name, ""))) for name in self.labelnames)
+
+    def render(self) -> list:
+        if self.function is not None:
+            self._values[()] = self.function()
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][i] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total, count) in sorted(self._values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                bucket_label = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(key, bucket_label)} {bucket_count}")
+            inf_label = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(key, inf_label)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: tuple = (), function=None) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames, function=function))
+
+
+def gauge(name: str, documentation: str, function=None) -> Gauge:
+    return registry.register(Gauge(name, documentation, function=function))
+
+
+def histogram(name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def resident_memory() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode(errors="replace").split()
+        if len(parts) >= 2 and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", registry.render().encode()
+        else:
+            status, body = "404 Not Found", b"Not Found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int):
+    return await asyncio.start_server(_handle, host, port)
+
+
+upstream_retries = counter("remix_upstream_retries_total", "Upstream calls retried, by upstream and exception type", ("upstream", "exception"))
+upstream_failures = counter("remix_upstream_failures_total", "Upstream calls that failed after all attempts, by upstream and exception type", ("upstream", "exception"))
+upstream_hedges = counter("remix_upstream_hedges_total", "Hedged duplicate upstream requests sent", ("upstream",))
+upstream_circuit_rejections = counter("remix_upstream_circuit_rejections_total", "Upstream calls rejected by an open circuit breaker", ("upstream",))
+upstream_request_seconds = histogram("remix_upstream_request_seconds", "Time of a single upstream request, excluding pool waits, retries and backoff", ("upstream",))
+queue_wait = histogram("remix_queue_wait_seconds", "Time a remix job waited in the queue before a worker picked it up")
+stage_seconds = histogram("remix_stage_seconds", "Time spent in each stage of a remix job", ("stage",))
+jobs = counter("remix_jobs_total", "Remix jobs by outcome", ("outcome",))
+job_failures = counter("remix_job_failures_total", "Remix jobs that failed, by exception type", ("exception",))
+jobs_throttled = counter("remix_jobs_throttled_total", "Remix jobs delayed by a user or guild rate limit")
+resident_memory_bytes = gauge("process_resident_memory_bytes", "Resident memory of the bot process in bytes", function=resident_memory)
+startup_seconds = gauge("remix_startup_seconds", "Seconds from process start until the bot was ready to take jobs")
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from collections import deque
+
+import httpx
+from colorama import Fore
+from colorama import Style as s
+
+import metrics
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, (asyncio.TimeoutError, httpx.TransportError))
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float):
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == "open" and self.retry_after() == 0:
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open":
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+        return self.state == "closed"
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_ignored(self):
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class Upstream:
+    def __init__(self, name: str, pool, timeout: float, min_timeout: float, max_timeout: float, timeout_multiplier: float = 2.0,
+                 max_attempts: int = 3, backoff: float = 1.0, hedge: bool = False, breaker: CircuitBreaker = None):
+        self.name = name
+        self.pool = pool
+        self.default_timeout = timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+
+    def timeout(self) -> float:
+        p99 = self.latency.percentile(0.99)
+        if p99 is None:
+            return self.default_timeout
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+
+    async def call(self, fn):
+        if not self.breaker.allow():
+            metrics.upstream_circuit_rejections.inc(upstream=self.name)
+            raise CircuitOpenError(self.name, self.breaker.retry_after())
+        for attempt in range(1, self.max_attempts + 1):
+            if attempt > 1 and self.breaker.state == "open":
+                metrics.upstream_circuit_rejections.inc(upstream=self.name)
+                raise CircuitOpenError(self.name, self.breaker.retry_after())
+            try:
+                result = await (self._hedged(fn) if self.hedge else self._attempt(fn))
+            except Exception as e:
+                transient = is_transient(e)
+                if not transient or attempt == self.max_attempts:
+                    if transient:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_ignored()
+                    metrics.upstream_failures.inc(upstream=self.name, exception=type(e).__name__)
+                    raise
+                metrics.upstream_retries.inc(upstream=self.name, exception=type(e).__name__)
+                print(f"{Fore.RED}{s.DIM}{self.name} {type(e).__name__}: {e}. Retrying ({attempt}/{self.max_attempts})...{s.RESET_ALL}")
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def _attempt(self, fn):
+        async with self.pool.client() as imagine:
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(fn(imagine), timeout=self.timeout())
+            finally:
+                elapsed = time.monotonic() - started
+                metrics.upstream_request_seconds.observe(elapsed, upstream=self.name)
+        self.latency.observe(elapsed)
+        return result
+
+    async def _hedged(self, fn):
+        delay = self.latency.percentile(0.95)
+        if delay is None:
+            return await self._attempt(fn)
+        tasks = {asyncio.ensure_future(self._attempt(fn))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                metrics.upstream_hedges.inc(upstream=self.name)
+                tasks.add(asyncio.ensure_future(self._attempt(fn)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
@@ -0,0 +1,178 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+
+class QueueFull(Exception):
+    pass
+
+
+class FairQueue:
+    def __init__(self, maxsize: int = 0):
+        self.maxsize = maxsize
+        self.in_flight = 0
+        self._classes = {}
+        self._counts = {}
+        self._size = 0
+        self._has_items = None
+
+    def qsize(self) -> int:
+        return self._size
+
+    def depth(self) -> int:
+        return self._size + self.in_flight
+
+    def full(self) -> bool:
+        return self.maxsize > 0 and self._size >= self.maxsize
+
+    def position(self, priority: int) -> int:
+        return sum(count for p, count in self._counts.items() if p <= priority)
+
+    def put_nowait(self, item, user_id, guild_id, priority: int = 0, not_before: float = 0.0, bounded: bool = True) -> int:
+        if bounded and self.full():
+            raise QueueFull(f"Queue is full ({self.maxsize} jobs waiting)")
+        guilds = self._classes.setdefault(priority, OrderedDict())
+        users = guilds.setdefault(guild_id, OrderedDict())
+        users.setdefault(user_id, deque()).append((not_before, item))
+        self._counts[priority] = self._counts.get(priority, 0) + 1
+        self._size += 1
+        if self._has_items is not None:
+            self._has_items.set()
+        return self.position(priority)
+
+    def _pop_ready(self, now: float):
+        for priority in sorted(self._classes):
+            guilds = self._classes[priority]
+            for guild_id, users in guilds.items():
+                for user_id, items in users.items():
+                    if items[0][0] > now:
+                        continue
+                    _, item = items.popleft()
+                    if items:
+                        users.move_to_end(user_id)
+                    else:
+                        del users[user_id]
+                    if users:
+                        guilds.move_to_end(guild_id)
+                    else:
+                        del guilds[guild_id]
+                    if not guilds:
+                        del self._classes[priority]
+                    self._counts[priority] -= 1
+                    self._size -= 1
+                    return item
+        return None
+
+    def _next_ready_at(self) -> float:
+        return min(items[0][0] for guilds in self._classes.values() for users in guilds.values() for items in users.values())
+
+    async def get(self):
+        if self._has_items is None:
+            self._has_items = asyncio.Event()
+        while True:
+            timeout = None
+            if self._size:
+                now = time.monotonic()
+                item = self._pop_ready(now)
+                if item is not None:
+                    self.in_flight += 1
+                    return item
+                timeout = max(0.0, self._next_ready_at() - now)
+            self._has_items.clear()
+            try:
+                await asyncio.wait_for(self._has_items.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def task_done(self):
+        self.in_flight -= 1
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost: float = 1) -> float:
+        self._refill()
+        return max(0.0, cost - self.tokens) / self.rate
+
+    def reserve(self, cost: float = 1) -> float:
+        self._refill()
+        self.tokens -= cost
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RateLimiter:
+    def __init__(self, per_minute: float, burst: float, max_keys: int = 10000):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def delay(self, key, cost: float = 1) -> float:
+        if self.rate <= 0:
+            return 0.0
+        cost = min(cost, self.burst)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return max(0.0, cost - self.burst) / self.rate
+        return bucket.delay(cost)
+
+    def reserve(self, key, cost: float = 1) -> float:
+        if self.rate <= 0:
+            return 0.0
+        cost = min(cost, self.burst)
+        bucket = self._buckets.pop(key, None) or TokenBucket(self.rate, self.burst)
+        self._buckets[key] = bucket
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return bucket.reserve(cost)
+
+
+class ServiceRate:
+    def __init__(self, window: float = 300, max_samples: int = 500):
+        self.window = window
+        self._completions = deque(maxlen=max_samples)
+
+    def record(self, count: int = 1):
+        now = time.monotonic()
+        self._completions.extend([now] * min(count, self._completions.maxlen))
+
+    def per_second(self):
+        now = time.monotonic()
+        while self._completions and now - self._completions[0] > self.window:
+            self._completions.popleft()
+        if len(self._completions) < 2:
+            return None
+        return (len(self._completions) - 1) / max(now - self._completions[0], 1e-3)
+
+
+class Coalescer:
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._followers = {}
+
+    def __len__(self):
+        return len(self._followers)
+
+    def attach(self, key, follower) -> bool:
+        followers = self._followers.get(key)
+        if followers is None:
+            self._followers[key] = []
+            self.leaders += 1
+            return False
+        followers.append(follower)
+        self.coalesced += 1
+        return True
+
+    def release(self, key) -> list:
+        return self._followers.pop(key, [])